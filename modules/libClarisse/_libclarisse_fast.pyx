@@ -0,0 +1,35 @@
+"""
+Optional compiled helpers for libClarisse. If this extension has not been built,
+libClarisse falls back to its pure python implementations.
+
+Build it in place with:
+
+    cythonize -i _libclarisse_fast.pyx
+"""
+
+from cpython.list cimport PyList_New, PyList_SET_ITEM
+from cpython.ref cimport Py_INCREF
+
+
+# ------------------------------------------------------------------------------
+def array_to_list(clarisse_array):
+    """
+    Convert a libClarisse array to a python list. The list is allocated at its
+    final size up front and filled in a C loop.
+
+    :param clarisse_array: The libClarisse array.
+
+    :return: A python list with the same items in it.
+    """
+
+    cdef Py_ssize_t count = clarisse_array.get_count()
+    cdef Py_ssize_t i
+    cdef list output = PyList_New(count)
+
+    for i in range(count):
+        item = clarisse_array[i]
+        # PyList_SET_ITEM steals a reference.
+        Py_INCREF(item)
+        PyList_SET_ITEM(output, i, item)
+
+    return output
@@ -1,16 +1,78 @@
-import os.path
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import shutil
 import tempfile
-import time
+import threading
 
 try:
     import ix
 except ImportError:
     ix = None
 
+try:
+    from . import _libclarisse_fast
+except (ImportError, ValueError):
+    # ValueError is what python 2 raises if this file is not imported as part
+    # of the libClarisse package.
+    _libclarisse_fast = None
+
 """
 A series of useful libClarisse functions.
 """
 
+# Names of bulk accessors that some libClarisse array types may offer. When
+# present they are used instead of reading the array one index at a time.
+_ARRAY_BULK_ACCESSORS = ("to_list", "get_items_as_list")
+
+# The list conversion routine to use for each libClarisse array type, filled in
+# the first time an array of that type is converted.
+_ARRAY_TO_LIST = dict()
+
+# The urls of contexts already found or created by create_context. Only the
+# urls are kept, never the context objects, so nothing in here can be left
+# pointing at an item that has since been deleted. _CACHE_GEN is bumped every
+# time the cache is invalidated so that a walk that started before the
+# invalidation does not put stale urls back into it. _CACHE_PROJECT is the
+# project file the urls were found in. The cache is invalidated whenever a
+# different project is open.
+_CONTEXT_EXISTS_CACHE = set()
+_CACHE_GEN = [0]
+_CACHE_PROJECT = [None]
+
+# The most contexts the cache above will hold before it is emptied, so that it
+# cannot grow without bound over a long session.
+_CONTEXT_CACHE_MAX = 4096
+
+# Clarisse objects that are reused between calls rather than recreated every
+# time. Kept per thread, since the same object must not be filled in by two
+# calls at once.
+_SCRATCH = threading.local()
+
+# File extensions of the files a context can reference.
+_PROJECT_SUFFIX = ".project"
+_ABC_SUFFIX = ".abc"
+_USD_SUFFIX = ".usd"
+_ANY_REF_SUFFIX = (_PROJECT_SUFFIX, _ABC_SUFFIX, _USD_SUFFIX)
+
+# The system temp directory, looked up once rather than on every export.
+_TEMP_DIR = tempfile.gettempdir()
+
+# Attribute types, looked up once so that the functions below do not have to go
+# through ix.api.OfAttr every time they are called.
+if ix is not None:
+    _TYPE_BOOL = ix.api.OfAttr.TYPE_BOOL
+    _TYPE_LONG = ix.api.OfAttr.TYPE_LONG
+    _TYPE_DOUBLE = ix.api.OfAttr.TYPE_DOUBLE
+    _TYPE_STRING = ix.api.OfAttr.TYPE_STRING
+    _TYPE_FILE = ix.api.OfAttr.TYPE_FILE
+    _TYPE_REFERENCE = ix.api.OfAttr.TYPE_REFERENCE
+    _TYPE_OBJECT = ix.api.OfAttr.TYPE_OBJECT
+
+    # The attribute types that localize looks in for $PDIR.
+    _PDIR_TYPES = frozenset((_TYPE_STRING, _TYPE_FILE))
+
 
 # ------------------------------------------------------------------------------
 def pdir_to_path(path, project_p):
@@ -25,12 +87,65 @@ def pdir_to_path(path, project_p):
              no checking to ensure that this path actually exists.
     """
 
-    if project_p.endswith(".project"):
-        project_p = os.path.split(project_p)[0]
+    # Most paths do not use $PDIR, and those are returned without any work.
+    if "$PDIR" not in path:
+        return path
+
+    return make_pdir_resolver(project_p)(path)
+
+
+# ------------------------------------------------------------------------------
+def pdir_to_paths(paths, project_p):
+    """
+    The same as pdir_to_path, but for a list of paths that are all relative to
+    the same project. The project directory is only worked out once.
+
+    :param paths: A list of paths that may or may not contain $PDIR.
+    :param project_p: The path to the project against which $PDIR is referenced.
+
+    :return: A list of paths where $PDIR has been converted to a real dir, in
+             the same order as paths. Does no checking to ensure that these
+             paths actually exist.
+    """
+
+    resolve = make_pdir_resolver(project_p)
+    return [resolve(path) for path in paths]
+
+
+# ------------------------------------------------------------------------------
+def make_pdir_resolver(project_p):
+    """
+    Returns a function that behaves like pdir_to_path for a fixed project. The
+    project directory is worked out once, when the function is made, and the
+    current working directory (for projects given as relative paths) at most
+    once, which is useful when converting a large number of paths in a loop.
+
+    :param project_p: The path to the project against which $PDIR is referenced.
+
+    :return: A function that takes a path that may or may not contain $PDIR and
+             returns it with $PDIR converted to a real dir.
+    """
+
+    if project_p.endswith(_PROJECT_SUFFIX):
+        project_p = os.path.dirname(project_p)
 
-    path = path.replace("$PDIR", project_p)
+    # Relative results are made absolute against the working directory. It is
+    # only looked up the first time one is needed, rather than calling
+    # os.path.abspath (and so os.getcwd) for every path.
+    cwd = list()
 
-    return path
+    def resolve(path):
+        # Most paths do not use $PDIR, and those are returned untouched.
+        if "$PDIR" not in path:
+            return path
+        path = path.replace("$PDIR", project_p)
+        if not os.path.isabs(path):
+            if not cwd:
+                cwd.append(os.getcwd())
+            path = os.path.join(cwd[0], path)
+        return os.path.normpath(path)
+
+    return resolve
 
 
 # ------------------------------------------------------------------------------
@@ -67,33 +182,35 @@ def localize(references):
     :return: Nothing.
     """
 
-    references = filter_contexts_to_references_only(contexts=references,
-                                                    project=True,
-                                                    abc=False,
-                                                    usd=False)
+    # Each reference's file is read once, while filtering, and kept with it.
+    # The references are made local below, so it would be wrong to keep these
+    # paths around for any longer than this one pass.
+    references = list(_iter_references_with_paths(contexts=references,
+                                                  project=True,
+                                                  abc=False,
+                                                  usd=False))
 
-    for context in references:
+    for context, file_p in references:
 
-        pdir = os.path.split(context.get_attribute("filename").get_string())[0]
+        pdir = os.path.split(file_p)[0]
 
         ix.cmds.MakeLocalContexts([context])
+        invalidate_context_cache()
 
         items = get_all_contexts(context=context, recursive=True)
         items.extend(get_all_objects(context=context))
 
         for item in items:
             if not(node_is_within_ref(item)):
-                attr_objs = list()
-                for attr_id in range(item.get_attribute_count()):
-                    attr_objs.append(item.get_attribute(attr_id))
+                # Only string and file attributes can hold $PDIR.
+                attr_objs = get_all_attributes(item, type_filter=_PDIR_TYPES)
                 for attr_obj in attr_objs:
-                    if attr_obj.get_type() == 3 or attr_obj.get_type() == 4:
-                        elem_count = attr_obj.get_value_count()
-                        for i in range(elem_count):
-                            value = attr_obj.get_raw_string(i)
-                            if "$PDIR" in value:
-                                value = value.replace("$PDIR", pdir)
-                                attr_obj.set_string(value, i)
+                    elem_count = attr_obj.get_value_count()
+                    for i in range(elem_count):
+                        value = attr_obj.get_raw_string(i)
+                        if "$PDIR" in value:
+                            value = value.replace("$PDIR", pdir)
+                            attr_obj.set_string(value, i)
 
 
 # ------------------------------------------------------------------------------
@@ -106,11 +223,93 @@ def clarisse_array_to_python_list(clarisse_array):
     :return: A python list with the same items in it.
     """
 
-    output = list()
-    for i in range(clarisse_array.get_count()):
-        output.append(clarisse_array[i])
+    array_type = type(clarisse_array)
+    try:
+        converter = _ARRAY_TO_LIST[array_type]
+    except KeyError:
+        converter = _get_array_converter(array_type)
+        _ARRAY_TO_LIST[array_type] = converter
 
-    return output
+    return converter(clarisse_array)
+
+
+# ------------------------------------------------------------------------------
+def _get_array_converter(array_type):
+    """
+    Finds the fastest way of converting a libClarisse array of the given type to
+    a python list. If the type offers a bulk accessor, that is used. If it can
+    be iterated over natively, the list is built straight from the iterator.
+    Otherwise the array is read one index at a time, using the compiled
+    _libclarisse_fast extension if it has been built.
+
+    :param array_type: The type of the libClarisse array.
+
+    :return: A function that takes an array of this type and returns a python
+             list.
+    """
+
+    for accessor in _ARRAY_BULK_ACCESSORS:
+        bulk_converter = getattr(array_type, accessor, None)
+        if bulk_converter is not None:
+            return bulk_converter
+
+    # Only trust a real __iter__. Arrays that just have __getitem__ would be
+    # iterated until an IndexError that they may never raise.
+    if hasattr(array_type, "__iter__"):
+        return list
+
+    if _libclarisse_fast is not None:
+        return _libclarisse_fast.array_to_list
+
+    return _indexed_array_to_list
+
+
+# ------------------------------------------------------------------------------
+def _indexed_array_to_list(clarisse_array):
+    """
+    Convert a libClarisse array to a python list by reading each index in turn.
+
+    :param clarisse_array: The libClarisse array.
+
+    :return: A python list with the same items in it.
+    """
+
+    getter = clarisse_array.__getitem__
+    return [getter(i) for i in range(clarisse_array.get_count())]
+
+
+# ------------------------------------------------------------------------------
+class _ArrayView(object):
+    """
+    A read-only python sequence on top of a libClarisse array. Items are only
+    fetched from the array when they are asked for, so callers that just need
+    the number of items (or only look at a few) do not pay for converting the
+    whole array.
+    """
+
+    __slots__ = ("_array", "_count")
+
+    def __init__(self, clarisse_array):
+        self._array = clarisse_array
+        self._count = clarisse_array.get_count()
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._array[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        # Check the bounds here, the Clarisse array may not.
+        if not 0 <= index < self._count:
+            raise IndexError("array index out of range")
+        return self._array[index]
+
+    def __iter__(self):
+        array = self._array
+        for i in range(self._count):
+            yield array[i]
 
 
 # ------------------------------------------------------------------------------
@@ -135,27 +334,113 @@ def create_context(context_url):
     """
     Create contexts recursively (if they already exist, nothing happens)
 
+    The urls of the parent contexts are cached so that creating many contexts
+    under the same parents does not check each parent again. The cache is
+    emptied whenever a different project is opened. Anything that deletes or
+    renames contexts without going through this module, or a File > New that
+    leaves the project file name unchanged, should be followed by a call to
+    invalidate_context_cache(). If a stale entry is left in the cache anyway
+    and the context cannot be created, the cache is emptied and the creation
+    is tried once more without it.
+
     :param context_url: The URL of the context(s) to create
 
     :return: The context object that was created.
     """
 
-    tokens = context_url.replace("project://", "/").split("/")
-
-    url = "project:/"
-    context = ix.item_exists(url)
-    for token in tokens:
-        url += "/" + token
-        context = ix.item_exists(url)
-        if not context:
-            context = ix.create_context(url)
+    # Skip empty tokens so that leading, trailing or doubled slashes do not
+    # produce urls like "project:///a".
+    tokens = [token for token in
+              context_url.replace("project://", "").split("/") if token]
+    if not tokens:
+        return ix.item_exists("project:/")
+    full_url = "project://" + "/".join(tokens)
+
+    # Most of the time the whole url already exists, in which case one lookup
+    # is enough and there is no need to walk its ancestors. This is always
+    # asked of Clarisse rather than the cache, since the context that is
+    # returned is used straight away by the caller.
+    context = ix.item_exists(full_url)
+    if context:
+        return context
+
+    # Urls cached while a different project was open mean nothing now.
+    project = ix.application.get_current_project_filename()
+    if project != _CACHE_PROJECT[0]:
+        invalidate_context_cache()
+        _CACHE_PROJECT[0] = project
+
+    cache_gen = _CACHE_GEN[0]
+    cache = _CONTEXT_EXISTS_CACHE
+
+    # The url of every ancestor along the way, from the top down. The full url
+    # itself is left out, it was checked above and is known not to exist.
+    urls = ["project://" + "/".join(tokens[:i + 1])
+            for i in range(len(tokens) - 1)]
+
+    used_cache = False
+    for url in urls:
+        if url in cache:
+            used_cache = True
+            continue
+        if ix.item_exists(url) or ix.create_context(url):
+            _remember_context(url, cache_gen)
+
+    context = ix.create_context(full_url)
+    if context:
+        _remember_context(full_url, cache_gen)
+    elif used_cache:
+        # One of the cached parents must have gone away. Walk again, this time
+        # checking every parent with Clarisse.
+        invalidate_context_cache()
+        return create_context(context_url)
 
     return context
 
 
+# ------------------------------------------------------------------------------
+def _remember_context(url, cache_gen):
+    """
+    Stores the url of a context that create_context found or created in the
+    context cache.
+
+    :param url: The url of the context.
+    :param cache_gen: The value of _CACHE_GEN when the caller started. If the
+           cache has been invalidated since, the url is not stored.
+
+    :return: Nothing.
+    """
+
+    if cache_gen != _CACHE_GEN[0]:
+        return
+
+    if len(_CONTEXT_EXISTS_CACHE) >= _CONTEXT_CACHE_MAX:
+        _CONTEXT_EXISTS_CACHE.clear()
+    _CONTEXT_EXISTS_CACHE.add(url)
+
+
+# ------------------------------------------------------------------------------
+def invalidate_context_cache():
+    """
+    Forgets every context that create_context has found or created. Call this
+    after deleting, renaming or otherwise restructuring contexts outside of
+    this module, or after starting a new project. Opening a different project
+    file is noticed by create_context itself.
+
+    :return: Nothing.
+    """
+
+    _CACHE_GEN[0] += 1
+    _CONTEXT_EXISTS_CACHE.clear()
+
+
+create_context.invalidate = invalidate_context_cache
+
+
 # ------------------------------------------------------------------------------
 def copy_node(node, dest_context_url, leave_breadcrumb=False,
-              breadcrumb_section="CLAM"):
+              breadcrumb_section="CLAM", defer_events=False,
+              flush_between_steps=False):
     """
     Given a node, copy that node to the destination url (which must be a
     context). If the destination context does not exist, it will be created.
@@ -166,33 +451,124 @@ def copy_node(node, dest_context_url, leave_breadcrumb=False,
            node indicating where it was copied from.
     :param breadcrumb_section: The breadcrumb will be put into a section of
            this name. Defaults to "CLAM"
+    :param defer_events: If True, the application events will not be processed
+           after the copy. The caller is then responsible for calling
+           ix.application.check_for_events() once it is done copying. Defaults
+           to False.
+    :param flush_between_steps: If True, the application events are also
+           processed between creating the breadcrumb and setting its value.
+           Only useful if the UI has to stay responsive in the middle of the
+           copy. Defaults to False.
+
+    :return: The node that was copied (the new instance, not the original).
+    """
+
+    dest_context = create_context(dest_context_url)
+
+    return _copy_node_to_context(node=node,
+                                 dest_context=dest_context,
+                                 leave_breadcrumb=leave_breadcrumb,
+                                 breadcrumb_section=breadcrumb_section,
+                                 defer_events=defer_events,
+                                 flush_between_steps=flush_between_steps)
+
 
-    :return: A full URL to the node that was copied.
+# ------------------------------------------------------------------------------
+def copy_nodes(nodes, dest_context_url, leave_breadcrumb=False,
+               breadcrumb_section="CLAM"):
     """
+    Given a list of nodes, copy them all to the destination url (which must be a
+    context). If the destination context does not exist, it will be created.
+    The application events are only processed once, after all of the nodes have
+    been copied.
+
+    :param nodes: A list of node objects to be copied.
+    :param dest_context_url: The context where the nodes will be copied to.
+    :param leave_breadcrumb: If True, a custom attribute will be added to each
+           node indicating where it was copied from.
+    :param breadcrumb_section: The breadcrumb will be put into a section of
+           this name. Defaults to "CLAM"
+
+    :return: A list of the nodes that were copied.
+    """
+
+    dest_context = create_context(dest_context_url)
 
-    dest_context = ix.item_exists(dest_context_url)
-    if not dest_context:
-        dest_context = create_context(dest_context_url)
+    instances = list()
+    for node in nodes:
+        instances.append(_copy_node_to_context(
+            node=node,
+            dest_context=dest_context,
+            leave_breadcrumb=leave_breadcrumb,
+            breadcrumb_section=breadcrumb_section,
+            defer_events=True,
+            flush_between_steps=False))
+
+    ix.application.check_for_events()
+    return instances
+
+
+# ------------------------------------------------------------------------------
+def _copy_node_to_context(node, dest_context, leave_breadcrumb,
+                          breadcrumb_section, defer_events,
+                          flush_between_steps):
+    """
+    Copies a node into a context object that is known to exist.
+
+    :param node: The node object to be copied.
+    :param dest_context: The context object where the node will be copied to.
+    :param leave_breadcrumb: If True, a custom attribute will be added to the
+           node indicating where it was copied from.
+    :param breadcrumb_section: The breadcrumb will be put into a section of
+           this name.
+    :param defer_events: If True, the application events will not be processed
+           after the copy.
+    :param flush_between_steps: If True, the application events are processed
+           between creating the breadcrumb and setting its value.
+
+    :return: The node that was copied.
+    """
 
     instance = dest_context.add_instance(node)
     instance.make_local()
 
     if leave_breadcrumb:
-        ix.cmds.CreateCustomAttribute([instance.get_full_name()],
+        inst_full = instance.get_full_name()
+        src_full = node.get_full_name()
+        ix.cmds.CreateCustomAttribute([inst_full],
                                       "copied_from", 3,
                                       ["container", "vhint", "group", "count",
                                        "allow_expression"],
                                       ["CONTAINER_SINGLE",
                                        "VISUAL_HINT_DEFAULT",
                                        breadcrumb_section, "1", "0"])
-        ix.application.check_for_events()
-        ix.cmds.SetValues([instance.get_full_name() + ".copied_from[0]"],
-                          [node.get_full_name])
+        if flush_between_steps:
+            ix.application.check_for_events()
+        ix.cmds.SetValues([inst_full + ".copied_from[0]"], [src_full])
 
-    ix.application.check_for_events()
+    if not defer_events:
+        ix.application.check_for_events()
     return instance
 
 
+# ------------------------------------------------------------------------------
+def _get_item_scratch():
+    """
+    Returns the bit field and item vector that get_all_contexts fills in. They
+    are made once per thread and then reused, rather than allocated by Clarisse
+    on every call.
+
+    :return: A tuple of (CoreBitFieldHelper, OfItemVector).
+    """
+
+    scratch = getattr(_SCRATCH, "items", None)
+    if scratch is None:
+        scratch = (ix.api.CoreBitFieldHelper(), ix.api.OfItemVector())
+        _SCRATCH.items = scratch
+
+    return scratch
+
+
 # ------------------------------------------------------------------------------
 def get_all_contexts(context, recursive):
     """
@@ -208,18 +584,36 @@ def get_all_contexts(context, recursive):
 
     output = list()
 
-    flags = ix.api.CoreBitFieldHelper()
-    ctx_array = ix.api.OfItemVector()
+    flags, ctx_array = _get_item_scratch()
 
     if not recursive:
+        ctx_array.remove_all()
         context.get_items(ctx_array, flags)
-    else:
-        context.get_all_items(ctx_array, flags)
-
-    items = clarisse_array_to_python_list(ctx_array)
-    for item in items:
-        if item.is_context():
-            output.append(item)
+        for item in clarisse_array_to_python_list(ctx_array):
+            if item.is_context():
+                output.append(item)
+        return output
+
+    # Walk down one level at a time, only descending into contexts. This avoids
+    # asking Clarisse for every object in the hierarchy (get_all_items) just to
+    # throw most of them away. The children are read straight out of the vector
+    # rather than copied to a python list first, since most of them are objects
+    # that are skipped. Each level is done with before the next one is fetched,
+    # so the same vector can be reused for all of them. Each context is output
+    # as it is taken off the stack, and its children are pushed in reverse, so
+    # that the contexts come out depth first in the same order as before.
+    stack = [context]
+    while stack:
+        parent = stack.pop()
+        if parent is not context:
+            output.append(parent)
+        ctx_array.remove_all()
+        parent.get_items(ctx_array, flags)
+        children = [item for item in
+                    (ctx_array[i] for i in range(ctx_array.get_count()))
+                    if item.is_context()]
+        children.reverse()
+        stack.extend(children)
 
     return output
 
@@ -262,25 +656,76 @@ def filter_contexts_to_references_only(contexts, project=True, abc=True,
              on which flags are set to True).
     """
 
-    output = list()
+    return list(iter_reference_contexts(contexts=contexts,
+                                        project=project,
+                                        abc=abc,
+                                        usd=usd))
+
+
+# ------------------------------------------------------------------------------
+def iter_reference_contexts(contexts, project=True, abc=True, usd=True):
+    """
+    The same as filter_contexts_to_references_only, but yields the matching
+    contexts one at a time instead of building a list. Useful when the caller
+    only needs to walk the result once, or may stop early (for example with
+    any()).
+
+    :param contexts: An iterable of contexts we are filtering.
+    :param project: If True, then references to libClarisse projects will be
+           yielded.
+    :param abc: If True, then references to alembic files will be yielded.
+    :param usd: If True, then references to USD files will be yielded.
+
+    :return: A generator of contexts that are references (included types
+             depending on which flags are set to True).
+    """
+
+    for context, _ in _iter_references_with_paths(contexts=contexts,
+                                                  project=project,
+                                                  abc=abc,
+                                                  usd=usd):
+        yield context
+
+
+# ------------------------------------------------------------------------------
+def _iter_references_with_paths(contexts, project, abc, usd):
+    """
+    Does the work for iter_reference_contexts. Along with each matching context
+    it yields the path to the file it references, which has to be read to do the
+    filtering anyway. Callers that need the path as well can then use it without
+    asking Clarisse for it a second time.
+
+    :param contexts: An iterable of contexts we are filtering.
+    :param project: If True, then references to libClarisse projects will be
+           yielded.
+    :param abc: If True, then references to alembic files will be yielded.
+    :param usd: If True, then references to USD files will be yielded.
+
+    :return: A generator of tuples of (context, path to the referenced file).
+    """
+
+    # Nothing can match, so do not even look at the contexts.
+    if not (project or abc or usd):
+        return
+
+    if project and abc and usd:
+        suffixes = _ANY_REF_SUFFIX
+    else:
+        suffixes = tuple(suffix for suffix, include in
+                         ((_PROJECT_SUFFIX, project),
+                          (_ABC_SUFFIX, abc),
+                          (_USD_SUFFIX, usd)) if include)
 
     for context in contexts:
 
-        if not context.is_context():
+        if not context.is_context() or not context.is_reference():
             continue
 
-        if context.is_reference():
-            if project:
-                if get_reference_file_path(context).endswith(".project"):
-                    output.append(context)
-            if abc:
-                if get_reference_file_path(context).endswith(".abc"):
-                    output.append(context)
-            if usd:
-                if get_reference_file_path(context).endswith(".usd"):
-                    output.append(context)
-
-    return output
+        # is_reference() was just checked, so read the filename directly rather
+        # than going through get_reference_file_path.
+        file_p = context.get_attribute("filename").get_string()
+        if file_p.endswith(suffixes):
+            yield context, file_p
 
 
 # ------------------------------------------------------------------------------
@@ -289,13 +734,60 @@ def get_all_objects(context):
     Returns a python list of all the child objects (recursively) of the passed
     context.
 
-    :param context:
-    :return:
+    :param context: The context to search.
+
+    :return: A list of objects.
     """
+
+    return clarisse_array_to_python_list(_get_all_objects_array(context))
+
+
+# ------------------------------------------------------------------------------
+def iter_all_objects(context):
+    """
+    The same as get_all_objects, but returns a read-only sequence that reads the
+    objects out of the underlying Clarisse array as they are needed, rather than
+    converting the whole array up front. It supports len(), indexing and
+    iteration. Use it straight away: the objects are only read when asked for,
+    so the scene should not be changed while the sequence is still in use.
+
+    :param context: The context to search.
+
+    :return: A sequence of objects.
+    """
+
+    return _ArrayView(_get_all_objects_array(context))
+
+
+# ------------------------------------------------------------------------------
+def count_all_objects(context):
+    """
+    Returns the number of child objects (recursively) of the passed context,
+    without converting them to a python list.
+
+    :param context: The context to search.
+
+    :return: The number of objects.
+    """
+
+    return _get_all_objects_array(context).get_count()
+
+
+# ------------------------------------------------------------------------------
+def _get_all_objects_array(context):
+    """
+    Fills a Clarisse array with all the child objects (recursively) of the
+    passed context.
+
+    :param context: The context to search.
+
+    :return: An OfObjectArray of objects.
+    """
+
     nodes_array = ix.api.OfObjectArray()
     context.get_all_objects("ProjectItem", nodes_array)
 
-    return clarisse_array_to_python_list(nodes_array)
+    return nodes_array
 
 
 # ------------------------------------------------------------------------------
@@ -304,8 +796,8 @@ def get_all_attributes(node, type_filter=None):
     Returns a python list of all the attribute objects for the object: "object".
 
     :param node: The node we want to collect attributes from.
-    :param type_filter: A list of types to limit the output list to. Defaults to
-           None. Options (as of Clarisse 3.6sp7) are:
+    :param type_filter: A type, or any iterable of types, to limit the output
+           list to. Defaults to None. Options (as of Clarisse 3.6sp7) are:
 
         TYPE_BOOL = 0,
         TYPE_LONG = 1,
@@ -320,17 +812,23 @@ def get_all_attributes(node, type_filter=None):
     :return: A python list of attributes.
     """
 
-    output = list()
-    if type_filter is not None and type(type_filter) is not list:
-        type_filter = [type_filter]
+    # A single type is an int. Anything else is taken to be an iterable of
+    # types (list, tuple, set, range, generator...). A frozenset makes the
+    # membership test below constant time.
+    if type_filter is not None:
+        if hasattr(type_filter, "__iter__"):
+            type_filter = frozenset(type_filter)
+        else:
+            type_filter = frozenset((type_filter,))
 
+    get_attribute = node.get_attribute
     attribute_count = node.get_attribute_count()
-    for i in range(0, attribute_count):
-        attr = node.get_attribute(i)
-        if not type_filter or attr.get_type() in type_filter:
-            output.append(attr)
 
-    return output
+    if not type_filter:
+        return [get_attribute(i) for i in range(attribute_count)]
+
+    return [attr for attr in (get_attribute(i) for i in range(attribute_count))
+            if attr.get_type() in type_filter]
 
 
 # ------------------------------------------------------------------------------
@@ -347,6 +845,21 @@ def get_attribute_obj(node, attr_name):
     return node.get_attribute(attr_name)
 
 
+if ix is not None:
+    # The name of the kind of array used to read the values of each attribute
+    # type. Any type not listed here (curves, actions...) is read as strings.
+    # The arrays are stored by name and only looked up on ix.api when used, so
+    # that importing this module does not depend on every one of them.
+    _VALUES_ARRAY_TYPES = {
+        _TYPE_BOOL: "IntArray",
+        _TYPE_LONG: "IntArray",
+        _TYPE_DOUBLE: "DoubleArray",
+        _TYPE_OBJECT: "OfObjectArray",
+    }
+else:
+    _VALUES_ARRAY_TYPES = dict()
+
+
 # ------------------------------------------------------------------------------
 def get_all_attribute_values(attribute):
     """
@@ -359,27 +872,9 @@ def get_all_attribute_values(attribute):
 
     # Get all the values of this attribute
     # TODO: Not all of these are mapped to the correct type
-    values_array = ix.api.CoreStringArray()
-    if attribute.get_type() == ix.api.OfAttr.TYPE_BOOL:
-        values_array = ix.api.IntArray()
-    if attribute.get_type() == ix.api.OfAttr.TYPE_LONG:
-        values_array = ix.api.IntArray()
-    if attribute.get_type() == ix.api.OfAttr.TYPE_DOUBLE:
-        values_array = ix.api.DoubleArray()
-    if attribute.get_type() == ix.api.OfAttr.TYPE_STRING:
-        values_array = ix.api.CoreStringArray()
-    if attribute.get_type() == ix.api.OfAttr.TYPE_FILE:
-        values_array = ix.api.CoreStringArray()
-    if attribute.get_type() == ix.api.OfAttr.TYPE_REFERENCE:
-        values_array = ix.api.CoreStringArray()
-    if attribute.get_type() == ix.api.OfAttr.TYPE_OBJECT:
-        values_array = ix.api.OfObjectArray()
-    if attribute.get_type() == ix.api.OfAttr.TYPE_CURVE:
-        values_array = ix.api.CoreStringArray()
-    if attribute.get_type() == ix.api.OfAttr.TYPE_ACTION:
-        values_array = ix.api.CoreStringArray()
-    if attribute.get_type() == ix.api.OfAttr.TYPE_COUNT:
-        values_array = ix.api.CoreStringArray()
+    array_name = _VALUES_ARRAY_TYPES.get(attribute.get_type(),
+                                         "CoreStringArray")
+    values_array = getattr(ix.api, array_name)()
 
     attribute.get_values(values_array)
 
@@ -405,21 +900,74 @@ def get_external_dependencies(context):
             clarisse_array_to_python_list(ext_sources))
 
 
+# ------------------------------------------------------------------------------
+def get_external_dependency_counts(context):
+    """
+    For the given context, count the external dependencies. Cheaper than
+    get_external_dependencies when the dependencies themselves are not needed.
+
+    :param context: The context for which we want the external dependencies.
+
+    :return: A tuple of two integers (number of external references, number of
+             external sources).
+    """
+
+    ext_refs = ix.api.OfItemSet()
+    ext_sources = ix.api.OfItemSet()
+    context.get_external_dependencies(ext_refs, ext_sources)
+
+    return ext_refs.get_count(), ext_sources.get_count()
+
+
+# ------------------------------------------------------------------------------
+def has_external_dependencies(context):
+    """
+    Returns whether the given context has any external dependencies at all.
+
+    :param context: The context to check.
+
+    :return: True if the context has any external references or sources, False
+             otherwise.
+    """
+
+    ext_ref_count, ext_source_count = get_external_dependency_counts(context)
+
+    return ext_ref_count > 0 or ext_source_count > 0
+
+
+# ------------------------------------------------------------------------------
+def _as_context_iterable(contexts):
+    """
+    Lets functions that work on a list of contexts also accept a single context.
+    A single context is wrapped in a tuple. Anything else is assumed to be an
+    iterable of contexts (list, tuple, generator...) and is returned as it is,
+    so that it can be consumed lazily.
+
+    :param contexts: A single context, or an iterable of contexts.
+
+    :return: An iterable of contexts.
+    """
+
+    if hasattr(contexts, "is_context"):
+        return (contexts,)
+    return contexts
+
+
 # ------------------------------------------------------------------------------
 def contexts_are_atomic(contexts):
     """
     For each context passed in the list: contexts, checks to see if they have
-    any external dependencies. Returns True if they do, False otherwise.
+    any external dependencies. Returns False as soon as one of them does, True
+    otherwise.
 
-    :param contexts: A list of contexts to check.
+    :param contexts: A list (or any iterable) of contexts to check, or a single
+           context.
 
-    :return: True if any of the contexts have external dependencies. False
+    :return: False if any of the contexts have external dependencies. True
              otherwise.
     """
 
-    # If contexts is not a list, make it one now
-    if not type(contexts) == list:
-        contexts = [contexts]
+    contexts = _as_context_iterable(contexts)
 
     for context in contexts:
 
@@ -427,15 +975,39 @@ def contexts_are_atomic(contexts):
         if not context.is_context():
             continue
 
-        ext_refs, ext_sources = get_external_dependencies(context)
-
-        if len(ext_refs) > 0 or len(ext_sources) > 0:
+        if has_external_dependencies(context):
             return False
-        return True
 
     return True
 
 
+# ------------------------------------------------------------------------------
+def _get_export_path(context, dest, overwrite):
+    """
+    Works out where a context should be exported to, checking that the export
+    is allowed.
+
+    :param context: The context that will be exported.
+    :param dest: The directory where the context should be exported. If this
+           directory does not exist or is a file, an AssertionError will be
+           raised.
+    :param overwrite: If False and the destination file already exists, an
+           IOError will be raised.
+
+    :return: The path the context should be exported to.
+    """
+
+    # isdir does a single stat, and is False if dest does not exist at all.
+    assert os.path.isdir(dest), dest
+
+    file_p = os.path.join(dest, context.get_name() + _PROJECT_SUFFIX)
+    if not overwrite and os.path.exists(file_p):
+        msg = "File exists and overwrite is False: " + file_p
+        raise IOError(msg)
+
+    return file_p
+
+
 # ------------------------------------------------------------------------------
 def export_context_without_deps(context, dest, overwrite=False):
     """
@@ -457,15 +1029,7 @@ def export_context_without_deps(context, dest, overwrite=False):
     :return: The path to the exported project.
     """
 
-    assert (os.path.exists(dest))
-    assert (os.path.isdir(dest))
-
-    file_p = os.path.join(dest, context.get_name() + ".project")
-    if os.path.exists(file_p):
-        if not overwrite:
-            msg = "File exists and overwrite is False: " + file_p
-            raise IOError(msg)
-    file_p = os.path.join(dest, context.get_name() + ".project")
+    file_p = _get_export_path(context, dest, overwrite)
     ix.ix.export_context_as_project(context, file_p)
 
     return file_p
@@ -495,15 +1059,15 @@ def export_context_with_deps(context, dest, overwrite=False):
     """
 
     # TODO: FIX THIS WHEN ISOTROPIX FIXES THE BUG
-    print "\n" * 5
-    print "#" * 200
-    print "WARNING!!!!!!!!!!!!!!!!!!!!!!!!"
-    print "-" * 20
-    print "THIS FUNCTION IS CURRENTLY BROKEN: "
-    print "     export_context_with_deps"
-    print "DUE TO A CLARISSE BUG. IT IS CURRENTLY BEING REPLACED WITH"
-    print "     export_context_without_deps"
-    print "UNTIL ISOTROPIX RELEASES A BUG FIX.\n\n"
+    print("\n" * 5)
+    print("#" * 200)
+    print("WARNING!!!!!!!!!!!!!!!!!!!!!!!!")
+    print("-" * 20)
+    print("THIS FUNCTION IS CURRENTLY BROKEN: ")
+    print("     export_context_with_deps")
+    print("DUE TO A CLARISSE BUG. IT IS CURRENTLY BEING REPLACED WITH")
+    print("     export_context_without_deps")
+    print("UNTIL ISOTROPIX RELEASES A BUG FIX.\n\n")
     file_p = export_context_without_deps(context=context,
                                          dest=dest,
                                          overwrite=overwrite)
@@ -511,50 +1075,71 @@ def export_context_with_deps(context, dest, overwrite=False):
 
     assert False  # DO NOT USE THIS FUNCTION TILL IT IS FIXED BY ISOTROPIX
 
-    assert(os.path.exists(dest))
-    assert(os.path.isdir(dest))
-
-    file_p = os.path.join(dest, context.get_name() + ".project")
-    if os.path.exists(file_p):
-        if not overwrite:
-            msg = "File exists and overwrite is False: " + file_p
-            raise IOError(msg)
-    file_p = os.path.join(dest, context.get_name() + ".project")
+    file_p = _get_export_path(context, dest, overwrite)
     ix.export_context_as_project_with_dependencies(context, file_p)
 
     return file_p
 
 
 # ------------------------------------------------------------------------------
-def make_contexts_atomic(contexts):
+def make_contexts_atomic(contexts, flush_between_steps=False):
     """
     For each of the contexts passed in the list: contexts, make this context
     atomic (have no external dependencies).
 
-    :param contexts: A list of contexts to make atomic.
+    :param contexts: A list (or any iterable) of contexts to make atomic, or a
+           single context.
+    :param flush_between_steps: If True, the application events are processed
+           after every step for each context instead of once per context. Only
+           useful if the UI has to stay responsive during a long run. Defaults
+           to False.
 
     :return: Nothing.
     """
 
-    # If contexts is not a list, make it one now
-    if not type(contexts) == list:
-        contexts = [contexts]
-
-    for context in contexts:
-
-        # ix.application.disable()
-
-        proj_p = export_context_with_deps(context, tempfile.gettempdir(), True)
-        ix.application.check_for_events()
-
-        temp_n = str(time.time()) + ".project"
-        temp_p = os.path.join(tempfile.gettempdir(), temp_n)
-        ix.cmds.ExportContextAsReference(context, temp_p)
-        ix.application.check_for_events()
-        ix.cmds.SetReferenceFilename([context], proj_p)
-        ix.application.check_for_events()
-        ix.cmds.MakeLocalContexts([context])
-        os.remove(temp_p)
+    contexts = _as_context_iterable(contexts)
+
+    temp_d = None
+    disabled = False
+    try:
+        # All of the temporary files for this batch go in one directory that
+        # is removed at the end, so that each file can simply be numbered.
+        temp_d = tempfile.mkdtemp(dir=_TEMP_DIR)
+
+        # Stop the application from redrawing between each of the commands
+        # below. It is always enabled again in the finally block, even if one
+        # of the commands fails.
+        ix.application.disable()
+        disabled = True
+
+        for i, context in enumerate(contexts):
+
+            # The export is named after the context, so each one gets its own
+            # directory in case two contexts in the batch share a name.
+            export_d = os.path.join(temp_d, str(i))
+            os.mkdir(export_d)
+            proj_p = export_context_with_deps(context, export_d, True)
+            if flush_between_steps:
+                ix.application.check_for_events()
+
+            temp_p = os.path.join(temp_d, str(i) + _PROJECT_SUFFIX)
+            ix.cmds.ExportContextAsReference(context, temp_p)
+            if flush_between_steps:
+                ix.application.check_for_events()
+            ix.cmds.SetReferenceFilename([context], proj_p)
+            if flush_between_steps:
+                ix.application.check_for_events()
+            ix.cmds.MakeLocalContexts([context])
+            invalidate_context_cache()
+
+            # The commands above do not depend on each other's events, so
+            # process them all at once for this context.
+            ix.application.check_for_events()
+    finally:
+        if disabled:
+            ix.application.enable()
+        if temp_d is not None:
+            shutil.rmtree(temp_d, ignore_errors=True)
 
 
 # ------------------------------------------------------------------------------
@@ -578,23 +1163,29 @@ def create_metadata_node(context, data, name):
     if meta_node is not None:
 
         # Unlock the object
-        ix.cmds.UnlockItems([meta_node.get_full_name()])
+        meta_full = meta_node.get_full_name()
+        ix.cmds.UnlockItems([meta_full])
 
     else:
 
         # Create the metadata object
         meta_node = context.add_object(name, "ProjectItem")
+        meta_full = meta_node.get_full_name()
 
     # Add or change the metadata on the object
+    # The value is passed through untouched. set_custom_attr converts it to
+    # whatever the attribute type needs.
+    # Indexed rather than unpacked, so that entries with extra items on the end
+    # are still accepted.
     for item in data:
         set_custom_attr(meta_node,
                         str(item[0]),
                         str(item[1]),
-                        str(item[2]),
+                        item[2],
                         str(item[3]))
 
     # lock it
-    ix.cmds.LockItems([meta_node.get_full_name()])
+    ix.cmds.LockItems([meta_full])
 
 
 # ------------------------------------------------------------------------------
@@ -643,6 +1234,164 @@ def get_current_project_file_name(return_full_path=True):
         return os.path.split(path)[1]
 
 
+# ------------------------------------------------------------------------------
+def _to_bool(value):
+    """
+    Interprets value as a boolean the same way a user typing it would expect.
+
+    :param value: The value to interpret. Usually a string like "yes" or "off".
+
+    :return: True if value reads as true, False otherwise.
+    """
+
+    return str(value).upper() in ("TRUE", "T", "YES", "Y", "1", "ON")
+
+
+# ------------------------------------------------------------------------------
+def _identity(value):
+    """
+    Returns value unchanged.
+
+    :param value: Any value.
+
+    :return: The same value.
+    """
+
+    return value
+
+
+# ------------------------------------------------------------------------------
+def _to_floats(count):
+    """
+    Builds a function that converts the first count items of a list or tuple to
+    floats.
+
+    :param count: The number of values to convert.
+
+    :return: A function that takes a list or tuple and returns a list of floats.
+    """
+
+    def to_floats(value):
+        return [float(value[i]) for i in range(count)]
+
+    return to_floats
+
+
+# ------------------------------------------------------------------------------
+def _set_doubles(attr, values):
+    """
+    Sets a multi-value double attribute (like a color) from a list of floats.
+
+    :param attr: The attribute to set.
+    :param values: A list of floats, one per value of the attribute.
+
+    :return: Nothing.
+    """
+
+    attr.set_value_count(len(values))
+    for i, value in enumerate(values):
+        attr.set_double(value, i)
+
+
+# ------------------------------------------------------------------------------
+def _set_vec3d(attr, values):
+    """
+    Sets a three value double attribute (like an rgb color) in one call.
+
+    :param attr: The attribute to set.
+    :param values: A list of three floats.
+
+    :return: Nothing.
+    """
+
+    attr.set_value_count(3)
+    attr.set_vec3d(ix.api.GMathVec3d(values[0], values[1], values[2]))
+
+
+# ------------------------------------------------------------------------------
+def _build_attr_spec():
+    """
+    Builds the table used by set_custom_attr to look up how each attribute type
+    is created and set.
+
+    :return: A dictionary keyed on the (lower case) attribute type name. Each
+             value is a tuple of (type, container, visual hint name, setter,
+             coerce) where setter is called with the new attribute and the
+             value after it has been passed through coerce. The visual hints
+             are stored by name and only looked up on ix.api.OfAttr when an
+             attribute of that type is made, so that a hint missing from this
+             version of Clarisse only breaks the types that use it.
+    """
+
+    ofattr = ix.api.OfAttr
+    single = ofattr.CONTAINER_SINGLE
+
+    # Single value attributes are set by calling the OfAttr method directly.
+    set_bool = ofattr.set_bool
+    set_long = ofattr.set_long
+    set_double = ofattr.set_double
+    set_string = ofattr.set_string
+    set_object = ofattr.set_object
+
+    # Set three value attributes in a single call when this version of Clarisse
+    # allows it.
+    if hasattr(ofattr, "set_vec3d") and hasattr(ix.api, "GMathVec3d"):
+        set_triple = _set_vec3d
+    else:
+        set_triple = _set_doubles
+
+    spec = {
+        "bool": (_TYPE_BOOL, single, "VISUAL_HINT_DEFAULT",
+                 set_bool, _to_bool),
+        "long": (_TYPE_LONG, single, "VISUAL_HINT_DEFAULT",
+                 set_long, int),
+        "double": (_TYPE_DOUBLE, single, "VISUAL_HINT_DEFAULT",
+                   set_double, float),
+        "string": (_TYPE_STRING, single, "VISUAL_HINT_DEFAULT",
+                   set_string, str),
+        "reference": (_TYPE_REFERENCE, single,
+                      "VISUAL_HINT_DEFAULT", set_object, _identity),
+        "percentage": (_TYPE_DOUBLE, single,
+                       "VISUAL_HINT_PERCENTAGE", set_double, float),
+        "distance": (_TYPE_DOUBLE, single, "VISUAL_HINT_DISTANCE",
+                     set_double, float),
+        "angle": (_TYPE_DOUBLE, single, "VISUAL_HINT_ANGLE",
+                  set_double, float),
+        "scale": (_TYPE_DOUBLE, single, "VISUAL_HINT_SCALE",
+                  set_double, float),
+        "frame": (_TYPE_LONG, single, "VISUAL_HINT_FRAME",
+                  set_long, int),
+        "subframe": (_TYPE_DOUBLE, single, "VISUAL_HINT_SUBFRAME",
+                     set_double, float),
+        "l": (_TYPE_DOUBLE, single, "VISUAL_HINT_L",
+              set_double, float),
+        "la": (_TYPE_DOUBLE, single, "VISUAL_HINT_LA",
+               _set_doubles, _to_floats(2)),
+        "rgb": (_TYPE_DOUBLE, single, "VISUAL_HINT_RGB",
+                set_triple, _to_floats(3)),
+        "rgba": (_TYPE_DOUBLE, single, "VISUAL_HINT_RGBA",
+                 _set_doubles, _to_floats(4)),
+        "filein": (_TYPE_FILE, single, "VISUAL_HINT_FILENAME_OPEN",
+                   set_string, str),
+        "fileout": (_TYPE_FILE, single, "VISUAL_HINT_FILENAME_SAVE",
+                    set_string, str),
+        "pixel": (_TYPE_DOUBLE, single, "VISUAL_HINT_PIXEL",
+                  set_double, float),
+        "subpixel": (_TYPE_DOUBLE, single, "VISUAL_HINT_SUBPIXEL",
+                     set_double, float),
+    }
+    spec["boolean"] = spec["bool"]
+    spec["integer"] = spec["long"]
+
+    return spec
+
+
+# The table built by _build_attr_spec. It is only filled in the first time
+# set_custom_attr is called, so that importing this module does not depend on
+# the attribute api.
+_ATTR_SPEC = dict()
+
+
 # ------------------------------------------------------------------------------
 def set_custom_attr(item,
                     section,
@@ -665,176 +1414,16 @@ def set_custom_attr(item,
     :return: A clarisse attribute object
     """
 
-    # Convert the attrType to all lowercase
-    attr_type = attr_type.lower()
-
-    if attr_type == "bool" or attr_type == "boolean":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_BOOL,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_DEFAULT,
-                                  section)
-        value = str(value)
-        if value.upper() in ["TRUE", "T", "YES", "Y", "1", "ON"]:
-            attr.set_bool(True)
-        else:
-            attr.set_bool(False)
-
-    elif attr_type == "long" or attr_type == "integer":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_LONG,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_DEFAULT,
-                                  section)
-        attr.set_long(int(value))
-
-    elif attr_type == "double":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_DOUBLE,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_DEFAULT,
-                                  section)
-        attr.set_long(float(value))
-
-    elif attr_type == "string":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_STRING,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_DEFAULT,
-                                  section)
-        attr.set_string(str(value))
-
-    elif attr_type == "reference":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_REFERENCE,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_DEFAULT,
-                                  section)
-        attr.set_object(value)
-
-    elif attr_type == "percentage":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_DOUBLE,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_PERCENTAGE,
-                                  section)
-        attr.set_double(float(value))
-
-    elif attr_type == "distance":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_DOUBLE,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_DISTANCE,
-                                  section)
-        attr.set_double(float(value))
-
-    elif attr_type == "angle":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_DOUBLE,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_ANGLE,
-                                  section)
-        attr.set_double(float(value))
-
-    elif attr_type == "scale":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_DOUBLE,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_SCALE,
-                                  section)
-        attr.set_double(float(value))
-
-    elif attr_type == "frame":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_LONG,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_FRAME,
-                                  section)
-        attr.set_long(int(value))
-
-    elif attr_type == "subframe":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_DOUBLE,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_SUBFRAME,
-                                  section)
-        attr.set_double(float(value))
-
-    elif attr_type == "l":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_DOUBLE,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_L,
-                                  section)
-        attr.set_double(float(value))
-
-    elif attr_type == "la":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_DOUBLE,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_LA,
-                                  section)
-        attr.set_value_count(2)
-        attr.set_double(float(value[0]), 0)
-        attr.set_double(float(value[1]), 1)
-
-    elif attr_type == "rgb":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_DOUBLE,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_RGB,
-                                  section)
-        attr.set_value_count(3)
-        attr.set_double(float(value[0]), 0)
-        attr.set_double(float(value[1]), 1)
-        attr.set_double(float(value[2]), 2)
-
-    elif attr_type == "rgba":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_DOUBLE,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_RGBA,
-                                  section)
-        attr.set_value_count(4)
-        attr.set_double(float(value[0]), 0)
-        attr.set_double(float(value[1]), 1)
-        attr.set_double(float(value[2]), 2)
-        attr.set_double(float(value[3]), 3)
-
-    elif attr_type == "filein":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_FILE,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_FILENAME_OPEN,
-                                  section)
-        attr.set_string(value)
-
-    elif attr_type == "fileout":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_FILE,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_FILENAME_SAVE,
-                                  section)
-        attr.set_string(value)
-
-    elif attr_type == "pixel":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_DOUBLE,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_PIXEL,
-                                  section)
-        attr.set_double(float(value))
-
-    elif attr_type == "subpixel":
-        attr = item.add_attribute(key,
-                                  ix.api.OfAttr.TYPE_DOUBLE,
-                                  ix.api.OfAttr.CONTAINER_SINGLE,
-                                  ix.api.OfAttr.VISUAL_HINT_SUBPIXEL,
-                                  section)
-        attr.set_double(float(value))
-
-    else:
+    if not _ATTR_SPEC:
+        _ATTR_SPEC.update(_build_attr_spec())
 
+    spec = _ATTR_SPEC.get(attr_type.lower())
+    if spec is None:
         raise TypeError("attrType not a legal type.")
 
+    type_id, container, hint_name, setter, coerce = spec
+    visual_hint = getattr(ix.api.OfAttr, hint_name)
+    attr = item.add_attribute(key, type_id, container, visual_hint, section)
+    setter(attr, coerce(value))
+
     return attr
@@ -78,7 +78,7 @@ def display_get_path_dialog(title):
 # ------------------------------------------------------------------------------
 def display_get_text_dialog(msg, title):
     """
-    Displays dialog box requesting a directory from the user.
+    Displays dialog box requesting a line of text from the user.
 
     :param msg: The message to display.
 
@@ -87,6 +87,13 @@ def display_get_text_dialog(msg, title):
     :return: The text entered by the user.
     """
 
-    text = ix.api.GuiWidget.open_folder(ix.application, '', title)
+    # Not every version of Clarisse has a text input dialog. Rather than show
+    # a different kind of dialog in its place, say so.
+    open_input_dialog = getattr(ix.api.GuiWidget, "open_input_dialog", None)
+    if open_input_dialog is None:
+        raise NotImplementedError("This version of Clarisse has no text input "
+                                  "dialog.")
+
+    text = open_input_dialog(ix.application, msg, title, '')
 
     return text